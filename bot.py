@@ -1,5 +1,6 @@
-import os, json, time, pathlib
+import asyncio, copy, dataclasses, logging, os, sqlite3, time, pathlib
 import discord
+import orjson
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
@@ -7,30 +8,93 @@ from dotenv import load_dotenv
 # Load .env (expects DISCORD_TOKEN, optional GUILD_ID)
 load_dotenv()
 
-TOKEN = os.getenv("DISCORD_TOKEN")
-TEST_GUILD_ID = int(os.getenv("GUILD_ID")) if os.getenv("GUILD_ID") else None
+@dataclasses.dataclass(frozen=True)
+class Env:
+    """Process environment, read once at import. ('Config' is taken by the
+    per-guild settings vocabulary in this file.)"""
+    token: str | None
+    test_guild_id: int | None
 
-INTENTS = discord.Intents.default()
-INTENTS.members = True
-INTENTS.guilds = True
+    @classmethod
+    def from_environ(cls) -> "Env":
+        gid = os.getenv("GUILD_ID")
+        return cls(token=os.getenv("DISCORD_TOKEN"), test_guild_id=int(gid) if gid else None)
+
+ENV = Env.from_environ()
+
+# Slash commands only: guilds + members is everything this bot reads.
+# Skipping the rest of the default intents keeps message/reaction/voice
+# gateway traffic from ever reaching the dispatcher.
+INTENTS = discord.Intents(guilds=True, members=True)
 
 CONFIG_DIR = pathlib.Path("./config")
 CONFIG_DIR.mkdir(exist_ok=True)
 
-def cfg_path(guild_id: int) -> pathlib.Path:
-    return CONFIG_DIR / f"{guild_id}.json"
+# Shared by every outgoing ping; AllowedMentions is never mutated after init.
+ALLOWED_MENTIONS = discord.AllowedMentions(roles=True, users=True, everyone=False)
+
+# Constant embed parts for the report commands; discord.Color.red()/orange()
+# allocate a new Color each call, so build them once.
+ROE_TITLE = "🚨 RoE Violation Report"
+ROE_COLOR = discord.Color.red()
+WAR_TITLE = "🛡️ War Declaration"
+WAR_COLOR = discord.Color.orange()
+
+# All guild configs live in one SQLite database: one row per guild instead
+# of one tiny file per guild, so reads and writes skip the per-file
+# open/stat overhead and the whole thing backs up as a single file.
+DB_PATH = CONFIG_DIR / "configs.db"
+_db = sqlite3.connect(DB_PATH)
+_db.execute("PRAGMA journal_mode=WAL")
+_db.execute("PRAGMA synchronous=NORMAL")
+_db.execute("CREATE TABLE IF NOT EXISTS cfg (guild_id INTEGER PRIMARY KEY, data TEXT, updated_at INTEGER, updated_by INTEGER)")
+_db.commit()
+
+# Parsed configs keyed by guild_id. This process owns the database, so
+# entries never go stale; values are deep-copied on the way out so callers
+# (e.g. SetupView) can mutate their copy freely.
+_CFG_CACHE: dict[int, dict] = {}
 
 def load_cfg(guild_id: int) -> dict:
-    p = cfg_path(guild_id)
-    if p.exists():
-        try:
-            return json.loads(p.read_text("utf-8"))
-        except Exception:
-            return {}
-    return {}
+    cached = _CFG_CACHE.get(guild_id)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    row = _db.execute("SELECT data FROM cfg WHERE guild_id=?", (guild_id,)).fetchone()
+    if row is None:
+        return {}
+    try:
+        data = orjson.loads(row[0])
+    except Exception:
+        return {}
+    _CFG_CACHE[guild_id] = data
+    return copy.deepcopy(data)
 
 def save_cfg(guild_id: int, data: dict) -> None:
-    cfg_path(guild_id).write_text(json.dumps(data, indent=2), encoding="utf-8")
+    _db.execute(
+        "INSERT OR REPLACE INTO cfg VALUES (?,?,?,?)",
+        (guild_id, orjson.dumps(data).decode(), data.get("updated_at"), data.get("updated_by"))
+    )
+    _db.commit()
+    _CFG_CACHE[guild_id] = copy.deepcopy(data)
+
+def preload_cfg_cache() -> None:
+    # One-time import of legacy per-guild JSON files left over from the
+    # old storage layout; existing rows win over stale files.
+    for p in CONFIG_DIR.glob("*.json"):
+        try:
+            gid = int(p.stem)
+            raw = orjson.dumps(orjson.loads(p.read_bytes())).decode()
+        except Exception:
+            continue
+        _db.execute("INSERT OR IGNORE INTO cfg (guild_id, data) VALUES (?,?)", (gid, raw))
+    _db.commit()
+    # Warm the cache in one SELECT so the first command in every guild
+    # after boot is an O(1) dict hit.
+    for gid, raw in _db.execute("SELECT guild_id, data FROM cfg"):
+        try:
+            _CFG_CACHE[gid] = orjson.loads(raw)
+        except Exception:
+            pass
 
 def get_role_mentions(guild: discord.Guild, role_ids: list[int]) -> str:
     roles = [guild.get_role(rid) for rid in (role_ids or [])]
@@ -42,53 +106,75 @@ def get_channel_mention(guild: discord.Guild, channel_id: int | None) -> str:
     ch = guild.get_channel(channel_id)
     return ch.mention if isinstance(ch, discord.TextChannel) else "Not set"
 
-def member_has_any_role(member: discord.Member, role_ids: list[int]) -> bool:
-    if not role_ids:
-        return False
-    member_role_ids = {r.id for r in member.roles}
-    return any(rid in member_role_ids for rid in role_ids)
-
 def can_use_commands(member: discord.Member, cfg: dict) -> tuple[bool, str]:
-    allowed = cfg.get("allowed_role_ids", [])
-    excluded = cfg.get("excluded_role_ids", [])
-    if not allowed:
-        return (False, "No allowed roles are configured yet. Ask an admin to run `/setup`.")
+    # Cheapest check first: DMs have no Member and no roles to inspect.
     if not isinstance(member, discord.Member):
         return (False, "Use this in a server.")
-    if not member_has_any_role(member, allowed):
+    allowed = set(cfg.get("allowed_role_ids", []))
+    if not allowed:
+        return (False, "No allowed roles are configured yet. Ask an admin to run `/setup`.")
+    # One pass over member.roles covers both the allow and exclude checks.
+    member_role_ids = {r.id for r in member.roles}
+    if allowed.isdisjoint(member_role_ids):
         return (False, "You don’t have a required role to use this command.")
-    if excluded and member_has_any_role(member, excluded):
+    excluded = set(cfg.get("excluded_role_ids", []))
+    if excluded and not excluded.isdisjoint(member_role_ids):
         return (False, "Your role is excluded from using this command.")
     return (True, "")
 
+# Strong references to in-flight background tasks — the event loop only
+# keeps weak refs, so an otherwise-unreferenced task can be garbage-collected
+# before it runs.
+_background_tasks: set[asyncio.Task] = set()
+
+def fire_and_forget(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
 async def log_action(guild: discord.Guild, cfg: dict, content: str, embed: discord.Embed | None = None):
-    log_channel_id = cfg.get("log_channel_id")
-    if not log_channel_id:
-        return
-    ch = guild.get_channel(log_channel_id)
-    if isinstance(ch, discord.TextChannel):
-        await ch.send(content=content, embed=embed, allowed_mentions=discord.AllowedMentions(roles=True, users=True, everyone=False))
+    # Runs as a fire-and-forget task, so swallow-and-log errors here rather
+    # than letting them die in the default task exception handler.
+    try:
+        log_channel_id = cfg.get("log_channel_id")
+        if not log_channel_id:
+            return
+        ch = guild.get_channel(log_channel_id)
+        if isinstance(ch, discord.TextChannel):
+            await ch.send(content=content, embed=embed, allowed_mentions=ALLOWED_MENTIONS)
+    except Exception:
+        logging.exception("Failed to send log message in guild %s", guild.id)
 
 # ---------------- UI Components ----------------
 
 class RolesSelect(discord.ui.Select):
-    def __init__(self, placeholder: str, preselected: list[int] | None = None, max_values: int = 25, row: int = 0):
+    __slots__ = ()
+
+    def __init__(self, placeholder: str, max_values: int = 25, row: int = 0):
         super().__init__(placeholder=placeholder, min_values=0, max_values=max_values, options=[], row=row)
-        self.preselected = set(preselected or [])
 
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
 class ChannelsSelect(discord.ui.Select):
-    def __init__(self, placeholder: str, allow_none: bool, preselected: int | None, row: int):
+    __slots__ = ()
+
+    def __init__(self, placeholder: str, allow_none: bool, row: int):
         super().__init__(placeholder=placeholder, min_values=0 if allow_none else 1, max_values=1, options=[], row=row)
-        self.allow_none = allow_none
-        self.preselected = preselected
 
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
 class SetupView(discord.ui.View):
+    # discord.ui.View instances still carry a __dict__ (the base class isn't
+    # slotted), but slot descriptors make these hot attributes C-level
+    # lookups in save() instead of dict probes.
+    __slots__ = (
+        "bot", "guild", "cfg", "invoker",
+        "allowed_select", "excluded_select", "admiral_select",
+        "war_select", "log_select", "save_btn", "cancel_btn",
+    )
+
     def __init__(self, bot: commands.Bot, guild: discord.Guild, cfg: dict, invoker: discord.Member, timeout: float = 600):
         super().__init__(timeout=timeout)
         self.bot = bot
@@ -102,43 +188,51 @@ class SetupView(discord.ui.View):
         war_channel_id = self.cfg.get("war_channel_id")
         log_channel_id = self.cfg.get("log_channel_id")
 
+        # Filter is_default(), sort, and trim the role list in one pass; the
+        # three selects only differ in which entries they mark as default.
+        role_bases = [
+            (r.id, r.name[:95])
+            for r in sorted((r for r in guild.roles if not r.is_default()), key=lambda r: -r.position)
+        ]
+
         # Allowed roles
-        self.allowed_select = RolesSelect("Allowed Roles (who can use commands)", list(allowed_ids), row=0)
-        allowed_opts = []
-        for r in sorted(guild.roles, key=lambda x: x.position, reverse=True):
-            if r.is_default(): continue
-            allowed_opts.append(discord.SelectOption(label=r.name[:95], value=str(r.id), default=(r.id in allowed_ids)))
-        self.allowed_select.options = allowed_opts
+        self.allowed_select = RolesSelect("Allowed Roles (who can use commands)", row=0)
+        self.allowed_select.options = [
+            discord.SelectOption(label=name, value=str(rid), default=(rid in allowed_ids))
+            for rid, name in role_bases
+        ]
 
         # Excluded roles
-        self.excluded_select = RolesSelect("Excluded Roles (block these)", list(excluded_ids), row=1)
-        excluded_opts = []
-        for r in sorted(guild.roles, key=lambda x: x.position, reverse=True):
-            if r.is_default(): continue
-            excluded_opts.append(discord.SelectOption(label=r.name[:95], value=str(r.id), default=(r.id in excluded_ids)))
-        self.excluded_select.options = excluded_opts
+        self.excluded_select = RolesSelect("Excluded Roles (block these)", row=1)
+        self.excluded_select.options = [
+            discord.SelectOption(label=name, value=str(rid), default=(rid in excluded_ids))
+            for rid, name in role_bases
+        ]
 
         # Admiral role (single select, allow none)
-        self.admiral_select = RolesSelect("Admiral Role (optional, pinged on /declare)", [admiral_id] if admiral_id else [], max_values=1, row=2)
-        admiral_opts = [discord.SelectOption(label="None", value="none", default=(admiral_id is None))]
-        for r in sorted(guild.roles, key=lambda x: x.position, reverse=True):
-            if r.is_default(): continue
-            admiral_opts.append(discord.SelectOption(label=r.name[:95], value=str(r.id), default=(r.id == admiral_id)))
-        self.admiral_select.options = admiral_opts
+        self.admiral_select = RolesSelect("Admiral Role (optional, pinged on /declare)", max_values=1, row=2)
+        self.admiral_select.options = [discord.SelectOption(label="None", value="none", default=(admiral_id is None))] + [
+            discord.SelectOption(label=name, value=str(rid), default=(rid == admiral_id))
+            for rid, name in role_bases
+        ]
+
+        # Same trick for the two channel selects: walk text_channels and
+        # format the labels once, then only the default flag differs.
+        channel_bases = [(ch.id, f"#{ch.name}"[:95]) for ch in guild.text_channels]
 
         # War channel
-        self.war_select = ChannelsSelect("War Declaration Channel (optional)", allow_none=True, preselected=war_channel_id, row=3)
-        war_opts = [discord.SelectOption(label="None", value="none", default=(war_channel_id is None))]
-        for ch in guild.text_channels:
-            war_opts.append(discord.SelectOption(label=f"#{ch.name}"[:95], value=str(ch.id), default=(ch.id == war_channel_id)))
-        self.war_select.options = war_opts
+        self.war_select = ChannelsSelect("War Declaration Channel (optional)", allow_none=True, row=3)
+        self.war_select.options = [discord.SelectOption(label="None", value="none", default=(war_channel_id is None))] + [
+            discord.SelectOption(label=name, value=str(cid), default=(cid == war_channel_id))
+            for cid, name in channel_bases
+        ]
 
         # Log channel (required)
-        self.log_select = ChannelsSelect("Log Channel (required, recommend private)", allow_none=False, preselected=log_channel_id, row=4)
-        log_opts = []
-        for ch in guild.text_channels:
-            log_opts.append(discord.SelectOption(label=f"#{ch.name}"[:95], value=str(ch.id), default=(ch.id == log_channel_id)))
-        self.log_select.options = log_opts
+        self.log_select = ChannelsSelect("Log Channel (required, recommend private)", allow_none=False, row=4)
+        self.log_select.options = [
+            discord.SelectOption(label=name, value=str(cid), default=(cid == log_channel_id))
+            for cid, name in channel_bases
+        ]
 
         # Buttons
         self.save_btn = discord.ui.Button(style=discord.ButtonStyle.success, label="Save", row=5)
@@ -198,12 +292,12 @@ class SetupView(discord.ui.View):
         summary = (
             f"**Allowed:** {get_role_mentions(self.guild, allowed) or '_none_'}\n"
             f"**Excluded:** {get_role_mentions(self.guild, excluded) or '_none_'}\n"
-            f"**Admiral Role:** {(self.guild.get_role(admiral_role_id).mention if admiral_role_id and self.guild.get_role(admiral_role_id) else 'Not set')}\n"
+            f"**Admiral Role:** {(r.mention if admiral_role_id and (r := self.guild.get_role(admiral_role_id)) else 'Not set')}\n"
             f"**War Channel:** {get_channel_mention(self.guild, war_channel_id)}\n"
             f"**Log Channel:** {get_channel_mention(self.guild, log_channel_id)}"
         )
         await interaction.response.edit_message(content="✅ **Configuration saved.**\n" + summary, view=None)
-        await log_action(self.guild, new_cfg, f"🛠️ Configuration updated by {interaction.user.mention}.\n{summary}")
+        fire_and_forget(log_action(self.guild, new_cfg, f"🛠️ Configuration updated by {interaction.user.mention}.\n{summary}"))
 
     async def cancel(self, interaction: discord.Interaction):
         await interaction.response.edit_message(content="Setup canceled. No changes saved.", view=None)
@@ -216,8 +310,9 @@ class Bot(commands.Bot):
         self.tree = app_commands.CommandTree(self)
 
     async def setup_hook(self):
-        if TEST_GUILD_ID:
-            guild_obj = discord.Object(id=TEST_GUILD_ID)
+        preload_cfg_cache()
+        if ENV.test_guild_id:
+            guild_obj = discord.Object(id=ENV.test_guild_id)
             self.tree.copy_global_to(guild=guild_obj)
             await self.tree.sync(guild=guild_obj)
         else:
@@ -261,7 +356,7 @@ async def config_show(interaction: discord.Interaction):
     if not cfg:
         return await interaction.response.send_message("No configuration saved yet. Ask an admin to run `/setup`.", ephemeral=True)
     admiral_role_id = cfg.get('admiral_role_id')
-    admiral_txt = (guild.get_role(admiral_role_id).mention if admiral_role_id and guild.get_role(admiral_role_id) else "Not set")
+    admiral_txt = (r.mention if admiral_role_id and (r := guild.get_role(admiral_role_id)) else "Not set")
     summary = (
         f"**Allowed:** {get_role_mentions(guild, cfg.get('allowed_role_ids', [])) or '_none_'}\n"
         f"**Excluded:** {get_role_mentions(guild, cfg.get('excluded_role_ids', [])) or '_none_'}\n"
@@ -316,8 +411,8 @@ async def roe(interaction: discord.Interaction, offender: discord.Member, target
     async def after_modal_submit(modal_inter: discord.Interaction, reason_text: str):
         ts = int(time.time())
         embed = discord.Embed(
-            title="🚨 RoE Violation Report",
-            color=discord.Color.red(),
+            title=ROE_TITLE,
+            color=ROE_COLOR,
             description=(
                 f"**Offender:** {offender.mention}\n"
                 f"**Reported by:** {interaction.user.mention}\n"
@@ -329,10 +424,11 @@ async def roe(interaction: discord.Interaction, offender: discord.Member, target
         msg = await interaction.channel.send(
             content=content,
             embed=embed,
-            allowed_mentions=discord.AllowedMentions(roles=True, users=True, everyone=False)
+            allowed_mentions=ALLOWED_MENTIONS
         )
         await modal_inter.response.send_message(f"Posted in {interaction.channel.mention} (jump: {msg.jump_url}).", ephemeral=True)
-        await log_action(guild, cfg, f"RoE reported by {interaction.user.mention} against {offender.mention} | Pinged {target_role.mention} in {interaction.channel.mention}.")
+        # Log off the critical path, and only once the post actually landed.
+        fire_and_forget(log_action(guild, cfg, f"RoE reported by {interaction.user.mention} against {offender.mention} | Pinged {target_role.mention} in {interaction.channel.mention}."))
 
     await interaction.response.send_modal(LongReasonModal(after_modal_submit))
 
@@ -352,8 +448,8 @@ async def declare(interaction: discord.Interaction, target: discord.Role):
     async def after_modal_submit(modal_inter: discord.Interaction, reason_text: str):
         ts = int(time.time())
         embed = discord.Embed(
-            title="🛡️ War Declaration",
-            color=discord.Color.orange(),
+            title=WAR_TITLE,
+            color=WAR_COLOR,
             description=(
                 f"**Declaring Against:** {target.mention}\n"
                 f"**Declared by:** {interaction.user.mention}\n"
@@ -368,29 +464,33 @@ async def declare(interaction: discord.Interaction, target: discord.Role):
             mentions.append(admiral_role.mention)
         content = " ".join(mentions) if mentions else None
 
-        # Post here
-        here = await interaction.channel.send(
+        send_kwargs = dict(
             content=content,
             embed=embed,
-            allowed_mentions=discord.AllowedMentions(roles=True, users=True, everyone=False)
+            allowed_mentions=ALLOWED_MENTIONS
         )
 
-        msg_links = [f"{interaction.channel.mention} (jump: {here.jump_url})"]
-        # Also post in war channel if configured
+        # Post here — and in the war channel concurrently if configured, so a
+        # two-channel declare pays one round-trip of latency, not two.
         if isinstance(war_channel, discord.TextChannel):
-            there = await war_channel.send(
-                content=content,
-                embed=embed,
-                allowed_mentions=discord.AllowedMentions(roles=True, users=True, everyone=False)
+            here, there = await asyncio.gather(
+                interaction.channel.send(**send_kwargs),
+                war_channel.send(**send_kwargs)
             )
-            msg_links.append(f"{war_channel.mention} (jump: {there.jump_url})")
+            msg_links = [
+                f"{interaction.channel.mention} (jump: {here.jump_url})",
+                f"{war_channel.mention} (jump: {there.jump_url})"
+            ]
+        else:
+            here = await interaction.channel.send(**send_kwargs)
+            msg_links = [f"{interaction.channel.mention} (jump: {here.jump_url})"]
 
         await modal_inter.response.send_message("Posted: " + " and ".join(msg_links), ephemeral=True)
-        await log_action(
+        fire_and_forget(log_action(
             guild, cfg,
             f"War declared by {interaction.user.mention} vs {target.mention}. "
             f"Pings: {content or 'none'}. Posted to: " + ", ".join(msg_links)
-        )
+        ))
 
     await interaction.response.send_modal(LongReasonModal(after_modal_submit))
 
@@ -399,6 +499,11 @@ async def on_ready():
     print(f"Logged in as {bot.user} (id: {bot.user.id}) — Aegis standing by.")
 
 if __name__ == "__main__":
-    if not TOKEN:
+    if not ENV.token:
         raise SystemExit("DISCORD_TOKEN missing. Set it in .env or environment.")
-    bot.run(TOKEN)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass  # optional; the default asyncio loop works fine
+    bot.run(ENV.token)